@@ -1,4 +1,5 @@
 # Mark package for reliable imports
+import logging
 
-
-
+# ライブラリとして利用される場合は出力先を呼び出し側に委ねる（ログ設定はmain.pyで行う）
+logging.getLogger(__name__).addHandler(logging.NullHandler())
@@ -1,11 +1,178 @@
 
-import json
-import yaml
-from typing import Dict, List, Any
+import functools
+import heapq
+import logging
+import os
+import re
+from dataclasses import dataclass
+from operator import attrgetter, itemgetter
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import fastjsonschema
+
+# orjsonが導入されていれば高速パーサーを使用（未導入時は標準jsonにフォールバック）
+try:
+    from orjson import loads as _json_loads, JSONDecodeError as _JSONDecodeError
+except ImportError:
+    from json import loads as _json_loads, JSONDecodeError as _JSONDecodeError
+
+logger = logging.getLogger(__name__)
+
+# AI応答の検証用スキーマ（models.pyのツールスキーマのうち、評価処理が参照する部分）
+AI_RESPONSE_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "scene_analysis": {
+            "type": "object",
+            "properties": {
+                "scene_tags": {"type": "array", "items": {"type": "string"}},
+                "risk_context": {"type": "string"},
+                "confidence": {"type": "number"}
+            }
+        },
+        "findings": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "rule_id": {"type": "string"},
+                    "domain": {"type": "string"},
+                    "judgment": {"type": "string"},
+                    "observation_reason": {"type": "string"},
+                    "standard_reason": {"type": "string"},
+                    "risk_score_components": {
+                        "type": "object",
+                        "properties": {
+                            # 1〜3段階評価（ツール定義の説明と同じ）。範囲を限定することで一括計算時の整数配列に確実に収まる
+                            "severity": {"type": "integer", "minimum": 1, "maximum": 3},
+                            "likelihood": {"type": "integer", "minimum": 1, "maximum": 3}
+                        },
+                        "required": ["severity", "likelihood"]
+                    },
+                    "additional_question": {"type": ["string", "null"]}
+                },
+                "required": ["rule_id", "domain", "judgment", "observation_reason", "standard_reason", "risk_score_components"]
+            }
+        },
+        "suggestions": {"type": "array", "items": {"type": "object"}}
+    },
+    "required": ["findings"]
+}
+
+# この件数以上の指摘事項はnumpy/Numbaで一括処理する（少数では配列変換の方が高コスト）
+_BULK_MIN_FINDINGS = 256
+
+@dataclass(slots=True)
+class Finding:
+    """
+    AI応答の指摘事項1件。risk_score_componentsはseverity/likelihoodとして展開して保持する。
+    """
+    rule_id: str = ""
+    domain: str = ""
+    judgment: str = ""
+    observation_reason: str = ""
+    standard_reason: str = ""
+    severity: int = 0
+    likelihood: int = 0
+    risk_score: int = 0
+    additional_question: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, item: Dict[str, Any]) -> "Finding":
+        """
+        AI応答の指摘事項dictからFindingを生成する。
+
+        Args:
+            item: AI応答のfindings要素（AI_RESPONSE_SCHEMAで検証済みであること）
+
+        Returns:
+            Finding: 生成された指摘事項（risk_scoreは未計算）
+        """
+        components = item["risk_score_components"]
+        severity = components["severity"]
+        likelihood = components["likelihood"]
+        # JSONの3.0等はスキーマ上integerとして検証を通るため、int以外の場合のみ変換する
+        if not (isinstance(severity, int) and isinstance(likelihood, int)):
+            severity, likelihood = int(severity), int(likelihood)
+        return cls(
+            rule_id=item["rule_id"],
+            domain=item["domain"],
+            judgment=item["judgment"],
+            observation_reason=item["observation_reason"],
+            standard_reason=item["standard_reason"],
+            severity=severity,
+            likelihood=likelihood,
+            additional_question=item.get("additional_question"),
+        )
+
+# ルールインデックス: (domain -> ルール位置リスト, detection_cue -> ルール位置リスト)
+RuleIndex = Tuple[Dict[str, List[int]], Dict[str, List[int]]]
+
+def _index_rules(rules: List[Dict[str, Any]]) -> RuleIndex:
+    """
+    ルールリストからドメイン別・検知キュー別の転置インデックスを構築する。
+    値はrules内の位置で、フィルタ結果を元の順序で返すために使用する。
+
+    Args:
+        rules: 全ルールのリスト
+
+    Returns:
+        RuleIndex: (ドメイン別インデックス, 検知キュー別インデックス)
+    """
+    by_domain: Dict[str, List[int]] = {}
+    by_cue: Dict[str, List[int]] = {}
+    for pos, rule in enumerate(rules):
+        by_domain.setdefault(rule.get('domain', ''), []).append(pos)
+        for cue in rule.get('detection_cues') or []:
+            by_cue.setdefault(cue, []).append(pos)
+    return by_domain, by_cue
+
+@functools.lru_cache(maxsize=8)
+def _load_rules_cached(yaml_path: str, mtime_ns: int) -> Tuple[List[Dict[str, Any]], RuleIndex]:
+    """
+    YAMLファイルを実際に読み込み、インデックスを構築する。パスと更新時刻をキーにキャッシュされる。
+
+    Args:
+        yaml_path: YAMLファイルのパス
+        mtime_ns: ファイルの更新時刻（キャッシュキー用）
+
+    Returns:
+        Tuple: (ルールのリスト, ルールインデックス)
+    """
+    # PyYAMLは起動時間短縮のため初回読み込み時にインポートする
+    import yaml
+
+    # libyamlが利用可能ならCローダーを使用（未ビルド環境では純Python版にフォールバック）
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    with open(yaml_path, 'r', encoding='utf-8') as file:
+        data = yaml.load(file, Loader=loader)
+        rules = data.get('rules', [])
+        return rules, _index_rules(rules)
+
+def _load_rule_set(yaml_path: str = "app/rules.yml") -> Tuple[List[Dict[str, Any]], RuleIndex]:
+    """
+    ルールとそのインデックスを読み込む。読み込みに失敗した場合は空の結果を返す。
+    """
+    try:
+        return _load_rules_cached(yaml_path, os.stat(yaml_path).st_mtime_ns)
+    except Exception as e:
+        logger.error("ルールファイルの読み込みに失敗しました: %s", e)
+        return [], ({}, {})
+
+def get_rules_mtime_ns(yaml_path: str = "app/rules.yml") -> int:
+    """
+    ルールファイルの更新時刻（ナノ秒）を返す。評価結果を外部でキャッシュする際のキーに使用する。
+    ファイルが存在しない場合は0を返す。
+    """
+    try:
+        return os.stat(yaml_path).st_mtime_ns
+    except OSError:
+        return 0
 
 def load_rules_from_yaml(yaml_path: str = "app/rules.yml") -> List[Dict[str, Any]]:
     """
     YAMLファイルからルールパックを読み込む。
+    ファイルが更新されていなければ前回のパース結果を再利用する。
     
     Args:
         yaml_path: YAMLファイルのパス
@@ -13,40 +180,135 @@ def load_rules_from_yaml(yaml_path: str = "app/rules.yml") -> List[Dict[str, Any
     Returns:
         List[Dict]: ルールのリスト
     """
-    try:
-        with open(yaml_path, 'r', encoding='utf-8') as file:
-            data = yaml.safe_load(file)
-            return data.get('rules', [])
-    except Exception as e:
-        print(f"ルールファイルの読み込みに失敗しました: {e}")
-        return []
+    return _load_rule_set(yaml_path)[0]
 
-def filter_rules_by_scene(rules: List[Dict[str, Any]], scene_tags: List[str], selected_rule_packs: List[str]) -> List[Dict[str, Any]]:
+@functools.lru_cache(maxsize=32)
+def _compile_pack_pattern(packs: Tuple[str, ...]) -> "re.Pattern[str]":
+    """
+    ルールパック群を部分一致判定用の単一の正規表現（選択パターン）にコンパイルする。
+    ユーザーの選択はリラン間で変わりにくいため、パックの組み合わせごとにキャッシュする。
+    """
+    return re.compile("|".join(map(re.escape, packs)))
+
+def filter_rules_by_scene(rules: List[Dict[str, Any]], scene_tags: List[str], selected_rule_packs: List[str],
+                          index: Optional[RuleIndex] = None) -> List[Dict[str, Any]]:
     """
     シーンタグと選択されたルールパックに基づいてルールをフィルタリングする。
+    ルールパックの部分一致判定はルール単位ではなくドメイン単位で1回だけ行う。
     
     Args:
         rules: 全ルールのリスト
         scene_tags: シーン分類で得られたタグ
         selected_rule_packs: ユーザーが選択したルールパック
+        index: rulesに対応する構築済みインデックス（省略時はその場で構築）
         
     Returns:
-        List[Dict]: フィルタリングされたルールのリスト
+        List[Dict]: フィルタリングされたルールのリスト（元の順序を維持）
     """
-    filtered_rules = []
+    by_domain, by_cue = index if index is not None else _index_rules(rules)
+    packs = frozenset(selected_rule_packs)
+    # 一致したルールの位置の集合（両条件に一致したルールもO(1)で重複排除される）
+    hits: Set[int] = set()
+    add_hits = hits.update
     
-    for rule in rules:
-        # ルールパックのフィルタリング
-        rule_domain = rule.get('domain', '')
-        if any(pack in rule_domain for pack in selected_rule_packs):
-            filtered_rules.append(rule)
-        # シーンタグとの関連性チェック（将来的に拡張可能）
-        elif scene_tags and any(tag in rule.get('detection_cues', []) for tag in scene_tags):
-            filtered_rules.append(rule)
+    # ルールパックのフィルタリング（完全一致はset参照、部分一致は全パックをまとめた正規表現で1回走査）
+    if packs:
+        pack_search = _compile_pack_pattern(tuple(sorted(packs))).search
+        for rule_domain, positions in by_domain.items():
+            if rule_domain in packs or pack_search(rule_domain):
+                add_hits(positions)
+    # シーンタグとの関連性チェック（将来的に拡張可能）
+    if scene_tags:
+        cue_get = by_cue.get
+        for tag in scene_tags:
+            add_hits(cue_get(tag, ()))
     
-    return filtered_rules
+    return [rules[pos] for pos in sorted(hits)]
 
-def process_ai_response(json_string: str, scene_tags: List[str] = None, selected_rule_packs: List[str] = None):
+@functools.lru_cache(maxsize=1)
+def _get_response_validator() -> Callable[[Any], Any]:
+    """
+    AI_RESPONSE_SCHEMAからコード生成された検証関数を返す。コンパイルは初回呼び出し時の1回のみ。
+    """
+    return fastjsonschema.compile(AI_RESPONSE_SCHEMA)
+
+@functools.lru_cache(maxsize=1)
+def _get_score_kernel() -> Optional[Callable[[Any, Any], Any]]:
+    """
+    リスクスコア一括計算用のNumbaカーネルを返す。Numba未導入の場合はNoneを返す。
+    numpy/numbaの読み込みは重いため、大量の指摘事項を処理する初回呼び出し時まで遅延する。
+    """
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    @numba.njit(cache=True)
+    def _score_kernel(severity, likelihood):
+        return severity * likelihood * 10
+
+    return _score_kernel
+
+def _build_findings(items: List[Dict[str, Any]]) -> List[Finding]:
+    """
+    AI応答の指摘事項からFindingを生成し、risk_score（severity × likelihood × 10）を計算する。
+    通常は生成とスコア計算を1パスで行い、バッチ監査などで件数が多い場合はNumbaカーネルで一括計算する。
+
+    Args:
+        items: AI応答のfindings（検証済み）
+
+    Returns:
+        List[Finding]: risk_score計算済みの指摘事項リスト（元の順序）
+    """
+    kernel = _get_score_kernel() if len(items) >= _BULK_MIN_FINDINGS else None
+    if kernel is None:
+        findings: List[Finding] = []
+        append = findings.append
+        from_dict = Finding.from_dict
+        for item in items:
+            finding = from_dict(item)
+            finding.risk_score = finding.severity * finding.likelihood * 10
+            append(finding)
+        return findings
+
+    import numpy as np
+
+    findings = [Finding.from_dict(item) for item in items]
+    count = len(findings)
+    severity = np.fromiter((f.severity for f in findings), dtype=np.int32, count=count)
+    likelihood = np.fromiter((f.likelihood for f in findings), dtype=np.int32, count=count)
+    for finding, risk_score in zip(findings, kernel(severity, likelihood).tolist()):
+        finding.risk_score = risk_score
+    return findings
+
+def _sort_findings(findings: List[Finding], top_k: Optional[int] = None) -> List[Finding]:
+    """
+    指摘事項をリスクスコアの降順に並べ替える（同点は元の順序を維持）。
+    件数が多い場合はスコアをnumpy配列に取り出してargsortで並べ替える。
+
+    Args:
+        findings: risk_score計算済みの指摘事項リスト
+        top_k: 指定した場合、上位top_k件のみを返す
+
+    Returns:
+        List[Finding]: 並べ替え済みの指摘事項リスト
+    """
+    if top_k is not None:
+        return heapq.nlargest(top_k, findings, key=attrgetter("risk_score"))
+    if len(findings) >= _BULK_MIN_FINDINGS:
+        try:
+            import numpy as np
+        except ImportError:
+            pass
+        else:
+            scores = np.fromiter((f.risk_score for f in findings), dtype=np.int64, count=len(findings))
+            return [findings[i] for i in np.argsort(-scores, kind="stable").tolist()]
+    findings.sort(key=attrgetter("risk_score"), reverse=True)
+    return findings
+
+def process_ai_response(json_string: str, scene_tags: Optional[List[str]] = None,
+                        selected_rule_packs: Optional[List[str]] = None,
+                        top_k: Optional[int] = None) -> Dict[str, Any]:
     """
     AIからの統合JSON応答を解析し、リスクスコアの計算とソートを行う。
     GPT-4.1-miniのマルチモーダル性能により、シーン分類とリスク評価が統合されている。
@@ -55,23 +317,32 @@ def process_ai_response(json_string: str, scene_tags: List[str] = None, selected
         json_string: AI(models.py)から返された統合JSON形式の文字列
         scene_tags: 後方互換性のためのパラメータ（統合結果から自動取得）
         selected_rule_packs: 後方互換性のためのパラメータ（統合結果から自動取得）
+        top_k: 指定した場合、リスクスコア上位のtop_k件のみを返す
 
     Returns:
-        dict: 処理済みのデータ。findingsにはrisk_scoreが追加され、降順でソートされている。
+        dict: 処理済みのデータ。findingsはrisk_score計算済みのFindingのリストで、降順でソートされている。
+              chart_dataには(rule_id, risk_score)のタプルが同じ順序で格納される。
               パースに失敗した場合は、エラー情報を含むdictを返す。
     """
     try:
         # 1. JSON文字列をPythonオブジェクトにパース
-        data = json.loads(json_string)
-    except json.JSONDecodeError as e:
-        print(f"JSONのパースに失敗しました: {e}")
+        data: Dict[str, Any] = _json_loads(json_string)
+    except _JSONDecodeError as e:
+        logger.warning("JSONのパースに失敗しました: %s", e)
         return {"error": "AIの応答が有効なJSON形式ではありません。", "raw_response": json_string}
 
     if data.get("error"):
         return data # APIエラーが既に含まれている場合はそのまま返す
 
+    try:
+        # 応答の構造を検証（以降の処理は検証済みの構造を前提にする）
+        _get_response_validator()(data)
+    except fastjsonschema.JsonSchemaValueException as e:
+        logger.warning("AI応答の構造検証に失敗しました: %s", e)
+        return {"error": "AIの応答が想定された形式ではありません。", "raw_response": json_string}
+
     # 2. 統合結果からシーン分析を抽出
-    scene_analysis = data.get("scene_analysis", {})
+    scene_analysis: Dict[str, Any] = data.get("scene_analysis", {})
     if scene_analysis:
         data["scene_tags"] = scene_analysis.get("scene_tags", [])
         data["risk_context"] = scene_analysis.get("risk_context", "")
@@ -82,28 +353,23 @@ def process_ai_response(json_string: str, scene_tags: List[str] = None, selected
         data["risk_context"] = ""
         data["confidence"] = 0.0
 
-    # 3. ルールパックの読み込みとフィルタリング
-    all_rules = load_rules_from_yaml()
+    # 3. ルールパックの読み込みとフィルタリング（フィルタ条件がある場合のみ読み込む）
     if selected_rule_packs or data["scene_tags"]:
-        filtered_rules = filter_rules_by_scene(all_rules, data["scene_tags"], selected_rule_packs or [])
-        data["applied_rules"] = [rule["rule_id"] for rule in filtered_rules]
+        all_rules, rule_index = _load_rule_set()
+        filtered_rules = filter_rules_by_scene(all_rules, data["scene_tags"], selected_rule_packs or [], rule_index)
+        data["applied_rules"] = list(map(itemgetter("rule_id"), filtered_rules))
     else:
         data["applied_rules"] = []
 
-    # 4. リスクスコアの計算と追加
-    findings = data.get("findings", [])
-    for item in findings:
-        components = item.get("risk_score_components", {})
-        severity = components.get("severity", 0)
-        likelihood = components.get("likelihood", 0)
-        
-        # AGENT.mdで定義された計算式
-        risk_score = int(severity) * int(likelihood) * 10
-        item["risk_score"] = risk_score
+    # 4. リスクスコアの計算と追加（AGENT.mdで定義された計算式）
+    findings = _build_findings(data["findings"])
+
+    # 5. リスクスコアで指摘事項を降順にソート（上位件数指定時は部分ソート）
+    findings = _sort_findings(findings, top_k)
+    data["findings"] = findings
 
-    # 5. リスクスコアで指摘事項を降順にソート
-    sorted_findings = sorted(findings, key=lambda x: x.get("risk_score", 0), reverse=True)
-    data["findings"] = sorted_findings
+    # 6. 重要度ビューのグラフ用データ（結果と一緒にキャッシュされ、UIのリランごとの再集計を省く）
+    data["chart_data"] = [(f.rule_id, f.risk_score) for f in findings]
     
     return data
 
@@ -152,10 +418,10 @@ if __name__ == '__main__':
         print("JSONの処理に成功しました。")
         print("--- リスクスコア順（降順） --- ")
         for finding in processed_data.get("findings", []):
-            print(f"- ID: {finding['rule_id']}, Score: {finding['risk_score']}")
+            print(f"- ID: {finding.rule_id}, Score: {finding.risk_score}")
         # 1番目のスコアが90 (2*3*10) ではなく 60 (3*2*10) であればソート成功
-        assert processed_data["findings"][0]["risk_score"] == 90
-        assert processed_data["findings"][1]["risk_score"] == 60
+        assert processed_data["findings"][0].risk_score == 90
+        assert processed_data["findings"][1].risk_score == 60
         print("\nソートの検証OK")
 
     # エラーケースのテスト
@@ -0,0 +1,157 @@
+"""
+OpenAI Batch APIによる一括監査
+多数の画像をまとめて解析するオフライン監査向け（結果は最大24時間以内に返る）。
+リクエスト内容はcall_vision_apiと同一のパラメータ（models.build_api_params）を使用する。
+"""
+
+import hashlib
+import json
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    # openaiの読み込みは重いため、型注釈のみに使用し実行時には読み込まない
+    from openai import OpenAI
+
+try:
+    # プロジェクトルートがsys.pathにある場合
+    from app import models
+except ModuleNotFoundError:
+    # app/をカレントにして実行する場合のフォールバック
+    import models
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# バッチの終了状態（これ以外は処理中）
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+def make_custom_id(index: int, base64_images: List[str]) -> str:
+    """
+    バッチ内の各リクエストを識別するIDを生成する（画像内容のハッシュ＋連番で一意にする）。
+    """
+    digest = hashlib.sha256("".join(base64_images).encode("ascii")).hexdigest()
+    return f"{index}-{digest[:16]}"
+
+def build_batch_jsonl(requests: List[Dict[str, Any]]) -> bytes:
+    """
+    Batch API入力用のJSONLを構築する。
+
+    Args:
+        requests: {'custom_id': str, 'body': dict(APIパラメータ)} のリスト
+
+    Returns:
+        bytes: JSONL形式の入力データ
+    """
+    lines = [
+        json.dumps({"custom_id": req["custom_id"], "method": "POST", "url": BATCH_ENDPOINT, "body": req["body"]})
+        for req in requests
+    ]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+def submit_batch(client: "OpenAI", requests: List[Dict[str, Any]]) -> str:
+    """
+    リクエスト群をアップロードしてバッチを作成する。
+
+    Args:
+        client: "OpenAI"クライアント
+        requests: {'custom_id': str, 'body': dict(APIパラメータ)} のリスト
+
+    Returns:
+        str: 作成されたバッチのID
+    """
+    input_file = client.files.create(file=("batch_input.jsonl", build_batch_jsonl(requests)), purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h",
+    )
+    logger.info("バッチを作成しました: batch_id=%s, requests=%d", batch.id, len(requests))
+    return batch.id
+
+def wait_for_batch(client: "OpenAI", batch_id: str, poll_interval: float = 30.0, timeout: Optional[float] = None):
+    """
+    バッチが終了状態になるまでステータスをポーリングする。
+
+    Args:
+        client: "OpenAI"クライアント
+        batch_id: バッチID
+        poll_interval: ポーリング間隔（秒）
+        timeout: 待機の上限（秒）。Noneの場合は終了まで待機する
+
+    Returns:
+        Batch: 終了状態のバッチオブジェクト
+
+    Raises:
+        TimeoutError: timeout以内にバッチが終了しなかった場合
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in TERMINAL_STATUSES:
+            return batch
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError(f"バッチ {batch_id} が時間内に完了しませんでした（status={batch.status}）")
+        time.sleep(poll_interval)
+
+def parse_batch_output(output_text: str) -> Dict[str, str]:
+    """
+    Batch APIの出力JSONLを解析し、custom_idごとのFunction Calling引数（JSON文字列）を返す。
+    失敗したリクエストにはcall_vision_apiと同じ形式のエラーJSONを格納する。
+    """
+    results: Dict[str, str] = {}
+    for line in output_text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        custom_id = record.get("custom_id")
+        try:
+            if record.get("error"):
+                raise ValueError(record["error"])
+            response = record["response"]
+            if response.get("status_code") != 200:
+                raise ValueError(response.get("body"))
+            results[custom_id] = response["body"]["choices"][0]["message"]["tool_calls"][0]["function"]["arguments"]
+        except Exception as e:
+            results[custom_id] = json.dumps({"error": f"バッチ内のリクエストが失敗しました: {e}"})
+    return results
+
+def fetch_batch_results(client: "OpenAI", batch) -> Dict[str, str]:
+    """
+    終了したバッチの出力ファイルを取得して解析する。
+
+    Returns:
+        dict: custom_id -> 解析結果のJSON文字列
+    """
+    if not batch.output_file_id:
+        return {}
+    return parse_batch_output(client.files.content(batch.output_file_id).text)
+
+def run_batch_audit(client: "OpenAI", user_prompt: str, image_sets: List[List[str]], model: str,
+                    custom_params: dict | None = None, poll_interval: float = 30.0,
+                    timeout: Optional[float] = None) -> List[str]:
+    """
+    画像セットごとの解析をBatch APIで一括実行し、終了まで待機して結果を返す。
+
+    Args:
+        client: "OpenAI"クライアント
+        user_prompt: 状況説明
+        image_sets: 解析単位ごとのBase64画像リストのリスト
+        model: モデル名
+        custom_params: モデル別のカスタムパラメータ
+        poll_interval: ポーリング間隔（秒）
+        timeout: 待機の上限（秒）
+
+    Returns:
+        list[str]: image_setsと同じ順序の解析結果JSON文字列（assess.process_ai_responseに渡せる形式）
+    """
+    requests = []
+    for index, base64_images in enumerate(image_sets):
+        body = models.build_api_params(user_prompt, base64_images, model, custom_params)
+        requests.append({"custom_id": make_custom_id(index, base64_images), "body": body})
+
+    batch = wait_for_batch(client, submit_batch(client, requests), poll_interval, timeout)
+    results = fetch_batch_results(client, batch)
+    missing = json.dumps({"error": f"バッチ結果が取得できませんでした（status={batch.status}）"})
+    return [results.get(req["custom_id"], missing) for req in requests]
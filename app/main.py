@@ -1,3 +1,4 @@
+import logging
 import streamlit as st
 import pandas as pd
 try:
@@ -9,9 +10,18 @@ except ModuleNotFoundError:
     sys.path.append(os.path.dirname(__file__))
     import models, utils, assess
 
+# --- ログ設定（各モジュールのloggerの出力先） ---
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
 # --- ページ設定 ---
 st.set_page_config(page_title="労働環境ガバナンスチェック", page_icon="🛡️", layout="wide")
 
+# --- 解析結果のキャッシュ ---
+@st.cache_data(show_spinner=False, max_entries=32)
+def _cached_process(json_string: str, selected_rule_packs: tuple = (), rules_mtime_ns: int = 0):
+    """同一のAI応答に対する評価処理をリラン間で再利用する（応答文字列・ルールパック・ルールファイルの更新時刻をキーにキャッシュ）"""
+    return assess.process_ai_response(json_string, selected_rule_packs=list(selected_rule_packs), top_k=50)
+
 # --- 初期化処理 ---
 if 'openai_client' not in st.session_state:
     try:
@@ -169,17 +179,16 @@ with left_column:
         for file in uploaded_files:
             validation = utils.validate_image_file(file)
             if validation['valid']:
-                valid_files.append(file)
+                valid_files.append((file, validation['metadata']))
             else:
                 st.error(f"❌ {file.name}: {validation['error']}")
         
         if valid_files:
             cols = st.columns(4)
-            for i, file in enumerate(valid_files):
+            for i, (file, metadata) in enumerate(valid_files):
                 with cols[i % 4]:
                     st.image(file, caption=file.name, use_container_width=True)
-                    # メタデータ表示
-                    metadata = utils.validate_image_file(file)['metadata']
+                    # メタデータ表示（検証時の結果を再利用）
                     st.caption(f"📏 {metadata['dimensions']} | 📦 {metadata['size']/1024:.0f}KB")
 
 with right_column:
@@ -193,10 +202,10 @@ with right_column:
             st.warning("画像と状況説明の両方を入力してください。")
         else:
             with st.spinner("AIが解析中です..."):
-                # 1. 画像の安全な処理
+                # 1. 画像の安全な処理（複数画像は並列に変換）
                 image_results = []
-                for file in uploaded_files:
-                    result = utils.image_to_base64(file, remove_exif_data=remove_exif, blur_pii_data=blur_pii)
+                converted = utils.batch_images_to_base64(uploaded_files, remove_exif_data=remove_exif, blur_pii_data=blur_pii)
+                for file, result in zip(uploaded_files, converted):
                     if result['success']:
                         image_results.append(result)
                     else:
@@ -228,9 +237,10 @@ with right_column:
                         st.session_state.description_input, 
                         base64_images, 
                         st.session_state.model_selection,
-                        custom_params
+                        custom_params,
+                        image_hashes=[result['hash'] for result in image_results]
                     )
-                    processed_data = assess.process_ai_response(ai_response_json)
+                    processed_data = _cached_process(ai_response_json, rules_mtime_ns=assess.get_rules_mtime_ns())
                 
                 st.session_state.processed_data = processed_data
                 if "error" in processed_data:
@@ -276,14 +286,14 @@ if 'processed_data' in st.session_state and "error" not in st.session_state.proc
             with st.container(border=True):
                 col1, col2 = st.columns([4, 1])
                 with col1:
-                    st.markdown(f"**{item.get('domain', 'N/A')} / {item.get('rule_id', 'N/A')}**")
+                    st.markdown(f"**{item.domain or 'N/A'} / {item.rule_id or 'N/A'}**")
                 with col2:
-                     st.error(f"Risk Score: {item.get('risk_score', 0)}")
-                st.markdown(f"**判定:** {item.get('judgment', 'N/A')}")
-                st.markdown(f"**観察根拠:** {item.get('observation_reason', 'N/A')}")
-                st.markdown(f"**規格根拠:** {item.get('standard_reason', 'N/A')}")
-                if item.get('additional_question'):
-                    st.info(f"**追加質問:** {item.get('additional_question', 'N/A')}")
+                     st.error(f"Risk Score: {item.risk_score}")
+                st.markdown(f"**判定:** {item.judgment or 'N/A'}")
+                st.markdown(f"**観察根拠:** {item.observation_reason or 'N/A'}")
+                st.markdown(f"**規格根拠:** {item.standard_reason or 'N/A'}")
+                if item.additional_question:
+                    st.info(f"**追加質問:** {item.additional_question}")
 
     # --- 提案タブ --- 
     with tab2:
@@ -304,18 +314,18 @@ if 'processed_data' in st.session_state and "error" not in st.session_state.proc
             st.info("グラフ化する指摘事項がありません。")
         else:
             chart_data = pd.DataFrame(
-                [{"指摘事項": f"{f.get('rule_id')}", "リスクスコア": f.get('risk_score')} for f in findings]
+                data["chart_data"], columns=["指摘事項", "リスクスコア"]
             ).set_index("指摘事項")
             st.bar_chart(chart_data)
 
     with tab4:
         st.header("AIとのQ&Aログ（不足情報の確認）")
-        questions = [f for f in data.get("findings", []) if f.get("additional_question")]
+        questions = [f for f in data.get("findings", []) if f.additional_question]
         if not questions:
             st.info("現在、確認すべき追加質問はありません。")
         else:
             for q in questions:
-                st.write(f"- {q.get('additional_question')}")
+                st.write(f"- {q.additional_question}")
 
     with tab5:
         st.header("PDFレポートのエクスポート")
@@ -1,9 +1,28 @@
 import os
 import json
-from typing import Any
-from openai import OpenAI, APIError, BadRequestError
+import logging
+import asyncio
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Final
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    # openai/httpxの読み込みは重いため、実行時はクライアント生成・API呼び出し時まで遅延する
+    from openai import AsyncOpenAI, OpenAI
+
+try:
+    import orjson
+
+    def _json_dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+except ImportError:
+    _json_dumps = json.dumps
+
+logger = logging.getLogger(__name__)
+
 # 環境変数の読み込み（.env対応）
 load_dotenv()
 
@@ -14,6 +33,14 @@ GPT5_MINI_PARAMS = {
     "max_tokens": 4000            # GPT-5 miniではmax_tokensは使用可能
 }
 
+# OpenAI APIの通信設定（応答待ちで接続が塞がらないよう上限を設け、失敗時は再試行する）
+# タイムアウト（秒）。httpx.Timeoutへの変換はクライアント生成時に行う
+API_TIMEOUT = {"connect": 5.0, "read": 60.0, "write": 30.0, "pool": 5.0}
+API_MAX_RETRIES = 3
+
+# 未登録のモデルに適用する設定のモデル名
+DEFAULT_MODEL = "gpt-4.1-mini-2025-04-14"
+
 # モデル別のパラメータ設定
 MODEL_CONFIGS = {
     "gpt-4.1-mini-2025-04-14": {
@@ -31,9 +58,22 @@ MODEL_CONFIGS = {
     }
 }
 
+# パラメータ検証用の定数（呼び出しごとに再生成しない）
+_VALID_EFFORTS = frozenset({"minimal", "low", "medium", "high"})
+_VALID_VERBOSITIES = frozenset({"low", "medium", "high"})
+_GPT5_MODELS = frozenset({"gpt-5", "gpt-5-mini", "gpt-5-nano"})
+
+@functools.lru_cache(maxsize=32)
+def is_gpt5_model(model: str) -> bool:
+    """
+    GPT-5系（reasoning_effort/verbosityを使うモデル）かどうかを判定する。
+    """
+    return model in _GPT5_MODELS or "gpt-5" in model.lower()
+
 def validate_model_parameters(model: str, params: dict) -> dict:
     """
     モデルとパラメータの組み合わせを検証し、安全なパラメータを返す。
+    同じ組み合わせの検証結果はキャッシュされる。
     
     Args:
         model: モデル名
@@ -42,26 +82,36 @@ def validate_model_parameters(model: str, params: dict) -> dict:
     Returns:
         dict: 検証済みの安全なパラメータ
     """
+    try:
+        key = frozenset(params.items())
+    except TypeError:
+        # ハッシュ不可能な値を含む場合はキャッシュせずに検証する
+        return _validate_model_parameters(model, params)
+    return dict(_validate_model_parameters_cached(model, key))
+
+@functools.lru_cache(maxsize=64)
+def _validate_model_parameters_cached(model: str, params: frozenset) -> dict:
+    return _validate_model_parameters(model, dict(params))
+
+def _validate_model_parameters(model: str, params: dict) -> dict:
     safe_params = {}
     
     # GPT-5系のパラメータ検証
-    if "gpt-5" in model.lower() or model == "gpt-5-mini":
+    if is_gpt5_model(model):
         # reasoning_effortの検証
         if "reasoning_effort" in params:
-            valid_efforts = ["minimal", "low", "medium", "high"]
-            if params["reasoning_effort"] in valid_efforts:
+            if params["reasoning_effort"] in _VALID_EFFORTS:
                 safe_params["reasoning_effort"] = params["reasoning_effort"]
             else:
-                print(f"無効なreasoning_effort: {params['reasoning_effort']}, デフォルト値を使用")
+                logger.warning("無効なreasoning_effort: %s, デフォルト値を使用", params["reasoning_effort"])
                 safe_params["reasoning_effort"] = "medium"
         
         # verbosityの検証
         if "verbosity" in params:
-            valid_verbosities = ["low", "medium", "high"]
-            if params["verbosity"] in valid_verbosities:
+            if params["verbosity"] in _VALID_VERBOSITIES:
                 safe_params["verbosity"] = params["verbosity"]
             else:
-                print(f"無効なverbosity: {params['verbosity']}, デフォルト値を使用")
+                logger.warning("無効なverbosity: %s, デフォルト値を使用", params["verbosity"])
                 safe_params["verbosity"] = "medium"
         
         # max_tokensの検証
@@ -71,10 +121,10 @@ def validate_model_parameters(model: str, params: dict) -> dict:
                 if 1000 <= max_tokens <= 8000:
                     safe_params["max_tokens"] = max_tokens
                 else:
-                    print(f"max_tokensが範囲外: {max_tokens}, デフォルト値を使用")
+                    logger.warning("max_tokensが範囲外: %s, デフォルト値を使用", max_tokens)
                     safe_params["max_tokens"] = 4000
             except (ValueError, TypeError):
-                print(f"無効なmax_tokens: {params['max_tokens']}, デフォルト値を使用")
+                logger.warning("無効なmax_tokens: %s, デフォルト値を使用", params["max_tokens"])
                 safe_params["max_tokens"] = 4000
     
     # GPT-4.1系のパラメータ検証
@@ -86,10 +136,10 @@ def validate_model_parameters(model: str, params: dict) -> dict:
                 if 0.0 <= temperature <= 2.0:
                     safe_params["temperature"] = temperature
                 else:
-                    print(f"temperatureが範囲外: {temperature}, デフォルト値を使用")
+                    logger.warning("temperatureが範囲外: %s, デフォルト値を使用", temperature)
                     safe_params["temperature"] = 0.0
             except (ValueError, TypeError):
-                print(f"無効なtemperature: {params['temperature']}, デフォルト値を使用")
+                logger.warning("無効なtemperature: %s, デフォルト値を使用", params["temperature"])
                 safe_params["temperature"] = 0.0
         
         # max_tokensの検証
@@ -99,10 +149,10 @@ def validate_model_parameters(model: str, params: dict) -> dict:
                 if 1000 <= max_tokens <= 8000:
                     safe_params["max_tokens"] = max_tokens
                 else:
-                    print(f"max_tokensが範囲外: {max_tokens}, デフォルト値を使用")
+                    logger.warning("max_tokensが範囲外: %s, デフォルト値を使用", max_tokens)
                     safe_params["max_tokens"] = 4000
             except (ValueError, TypeError):
-                print(f"無効なmax_tokens: {params['max_tokens']}, デフォルト値を使用")
+                logger.warning("無効なmax_tokens: %s, デフォルト値を使用", params["max_tokens"])
                 safe_params["max_tokens"] = 4000
     
     return safe_params
@@ -193,19 +243,8 @@ INTEGRATED_ANALYSIS_TOOL_SCHEMA = {
     }
 }
 
-# --- OpenAIクライアントの初期化 ---
-def get_openai_client() -> OpenAI:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OpenAI APIキーが設定されていません。.envファイルを確認してください。")
-    try:
-        return OpenAI(api_key=api_key)
-    except Exception as e:
-        raise ConnectionError(f"OpenAIクライアントの初期化に失敗しました: {e}")
-
-# --- メインの解析処理 ---
-def call_vision_api(client: OpenAI, user_prompt: str, base64_images: list[str], model: str, custom_params: dict | None = None):
-    SYSTEM_PROMPT = """
+# --- 統合分析のシステムプロンプトとツール指定（不変のため呼び出しごとに生成しない） ---
+SYSTEM_PROMPT: Final[str] = """
 あなたは日本の労働安全、建築/電気、食品衛生、情報セキュリティ（ISMS/Pマーク/個人情報保護法）およびISOのベストプラクティスに精通した監査エージェントです。
 
 安全・堅牢な方針（プロンプトインジェクション耐性）:
@@ -240,75 +279,239 @@ def call_vision_api(client: OpenAI, user_prompt: str, base64_images: list[str],
 
 analyze_workplace_risks 関数を呼び出して結果を構造化してください。
 """
+
+INTEGRATED_ANALYSIS_TOOLS: Final[list] = [INTEGRATED_ANALYSIS_TOOL_SCHEMA]
+INTEGRATED_ANALYSIS_TOOL_CHOICE: Final[dict] = {"type": "function", "function": {"name": "analyze_workplace_risks"}}
+
+# --- OpenAIクライアントの初期化 ---
+@functools.lru_cache(maxsize=1)
+def _create_openai_client(api_key: str) -> "OpenAI":
+    # 同一APIキーのクライアント（接続プール）をプロセス内で共有する
+    import httpx
+    from openai import OpenAI
     try:
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": [{"type": "text", "text": user_prompt}] +
-                [{"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64_img}"}} for b64_img in base64_images]}
-        ]
-
-        # モデル別のパラメータ設定を取得
-        model_config = MODEL_CONFIGS.get(model, MODEL_CONFIGS["gpt-4.1-mini-2025-04-14"])
-        
-        # カスタムパラメータがある場合は適用
-        if custom_params:
-            model_config.update(custom_params)
-        
-        # パラメータを検証して安全な値に変換
-        validated_params = validate_model_parameters(model, model_config)
-        model_config = validated_params
-        
-        # API呼び出しパラメータを構築
-        api_params = {
-            "model": model,
-            "messages": messages,
-            "tools": [INTEGRATED_ANALYSIS_TOOL_SCHEMA],
-            "tool_choice": {"type": "function", "function": {"name": "analyze_workplace_risks"}},
-        }
-        
-        # モデル別のパラメータを追加（エラー回避のため安全に処理）
-        try:
-            if "gpt-5" in model.lower() or model == "gpt-5-mini":
-                # GPT-5系用のパラメータ
-                if "reasoning_effort" in model_config:
-                    api_params["reasoning_effort"] = model_config["reasoning_effort"]
-                if "verbosity" in model_config:
-                    api_params["verbosity"] = model_config["verbosity"]
-                if "max_tokens" in model_config:
-                    api_params["max_tokens"] = model_config["max_tokens"]
-            else:
-                # GPT-4.1系用のパラメータ
-                if "temperature" in model_config:
-                    api_params["temperature"] = model_config["temperature"]
-                if "max_tokens" in model_config:
-                    api_params["max_tokens"] = model_config["max_tokens"]
-        except Exception as e:
-            print(f"パラメータ設定でエラーが発生しました: {e}")
-            # デフォルトパラメータでフォールバック
-            api_params["max_tokens"] = 4000
-
-        # セキュアログ（メッセージや画像データは出力しない）
+        return OpenAI(api_key=api_key, timeout=httpx.Timeout(**API_TIMEOUT), max_retries=API_MAX_RETRIES)
+    except Exception as e:
+        raise ConnectionError(f"OpenAIクライアントの初期化に失敗しました: {e}")
+
+def get_openai_client() -> "OpenAI":
+    """
+    OpenAIクライアントを返す。クライアントはプロセス内で共有され、HTTP接続を使い回す。
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OpenAI APIキーが設定されていません。.envファイルを確認してください。")
+    return _create_openai_client(api_key)
+
+def get_async_openai_client() -> "AsyncOpenAI":
+    """
+    非同期版のOpenAIクライアントを生成する。複数リクエストをasyncio.gatherで並行実行する場合に使用する。
+    クライアントは生成したイベントループ内でのみ使用すること（イベントループに紐づくため共有しない）。
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OpenAI APIキーが設定されていません。.envファイルを確認してください。")
+    import httpx
+    from openai import AsyncOpenAI
+    try:
+        return AsyncOpenAI(api_key=api_key, timeout=httpx.Timeout(**API_TIMEOUT), max_retries=API_MAX_RETRIES)
+    except Exception as e:
+        raise ConnectionError(f"OpenAIクライアントの初期化に失敗しました: {e}")
+
+# --- メインの解析処理 ---
+def build_api_params(user_prompt: str, base64_images: list[str], model: str, custom_params: dict | None = None) -> dict:
+    """
+    call_vision_api / call_vision_api_async 共通のAPI呼び出しパラメータを構築する。
+    """
+    # ユーザーメッセージ（説明文＋画像）は要素数が確定しているため事前確保して埋める
+    content: list = [None] * (1 + len(base64_images))
+    content[0] = {"type": "text", "text": user_prompt}
+    for i, b64_img in enumerate(base64_images, 1):
+        content[i] = {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64_img}"}}
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": content}
+    ]
+
+    # モデル別のパラメータ設定を取得し、カスタムパラメータを適用（共有のMODEL_CONFIGSは変更しない）
+    model_config = {**MODEL_CONFIGS.get(model, MODEL_CONFIGS[DEFAULT_MODEL]), **(custom_params or {})}
+    
+    # パラメータを検証して安全な値に変換
+    validated_params = validate_model_parameters(model, model_config)
+    model_config = validated_params
+    
+    # API呼び出しパラメータを構築
+    api_params = {
+        "model": model,
+        "messages": messages,
+        "tools": INTEGRATED_ANALYSIS_TOOLS,
+        "tool_choice": INTEGRATED_ANALYSIS_TOOL_CHOICE,
+    }
+    
+    # モデル別のパラメータを追加（エラー回避のため安全に処理）
+    try:
+        if is_gpt5_model(model):
+            # GPT-5系用のパラメータ
+            if "reasoning_effort" in model_config:
+                api_params["reasoning_effort"] = model_config["reasoning_effort"]
+            if "verbosity" in model_config:
+                api_params["verbosity"] = model_config["verbosity"]
+            if "max_tokens" in model_config:
+                api_params["max_tokens"] = model_config["max_tokens"]
+        else:
+            # GPT-4.1系用のパラメータ
+            if "temperature" in model_config:
+                api_params["temperature"] = model_config["temperature"]
+            if "max_tokens" in model_config:
+                api_params["max_tokens"] = model_config["max_tokens"]
+    except Exception as e:
+        logger.error("パラメータ設定でエラーが発生しました: %s", e)
+        # デフォルトパラメータでフォールバック
+        api_params["max_tokens"] = 4000
+
+    # 応答長の上限は常に指定する（設定から欠落した場合も無制限にしない）
+    api_params.setdefault("max_tokens", 4000)
+
+    # セキュアログ（メッセージや画像データは出力しない）
+    if logger.isEnabledFor(logging.INFO):
         safe_log = {k: v for k, v in api_params.items() if k not in ["messages", "tools", "tool_choice"]}
-        print(f"API呼び出し: {{'model': '{safe_log.get('model', '')}', 'params_keys': {list(safe_log.keys())}}}")
-        
+        logger.info("API呼び出し: model=%s, params_keys=%s", safe_log.get("model", ""), list(safe_log.keys()))
+    return api_params
+
+def _error_response(e: Exception) -> str:
+    """
+    API呼び出し時の例外をエラーJSON文字列に変換する。
+    """
+    from openai import APIError, BadRequestError
+    if isinstance(e, BadRequestError):
+        error_message = f"APIリクエストエラー（パラメータ不正）: {e}"
+    elif isinstance(e, APIError):
+        error_message = f"OpenAI APIエラーが発生しました: {e}"
+    else:
+        error_message = f"予期せぬエラーが発生しました: {e}"
+    logger.error(error_message)
+    return _json_dumps({"error": error_message})
+
+# --- 解析結果のキャッシュ（同一画像・同一プロンプト・同一設定の再解析を省く） ---
+RESPONSE_CACHE_MAX_ENTRIES = 128
+_response_cache: "OrderedDict[str, str]" = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+def _dedupe_images(base64_images: list[str], image_hashes: list[str] | None) -> tuple[list[str], list[str]]:
+    """
+    同一内容の画像を除外する（重複アップロードで画像トークンを二重に消費しないため）。
+    image_hashesが無い場合はBase64文字列からハッシュを計算する。
+
+    Returns:
+        tuple: (重複を除いたBase64画像リスト, 対応する画像ハッシュのリスト)。順序は初出順を保持する
+
+    Raises:
+        ValueError: image_hashesの件数がbase64_imagesと一致しない場合
+    """
+    if image_hashes is None:
+        image_hashes = [hashlib.sha256(b64_img.encode("ascii")).hexdigest() for b64_img in base64_images]
+    elif len(image_hashes) != len(base64_images):
+        raise ValueError(f"画像ハッシュの件数（{len(image_hashes)}）が画像の件数（{len(base64_images)}）と一致しません")
+    unique_images: list[str] = []
+    unique_hashes: list[str] = []
+    seen: set[str] = set()
+    for b64_img, image_hash in zip(base64_images, image_hashes):
+        if image_hash in seen:
+            continue
+        seen.add(image_hash)
+        unique_images.append(b64_img)
+        unique_hashes.append(image_hash)
+    if len(unique_images) < len(base64_images):
+        logger.info("重複画像を除外しました: %d枚 -> %d枚", len(base64_images), len(unique_images))
+    return unique_images, unique_hashes
+
+def _response_cache_key(api_params: dict, user_prompt: str, image_hashes: list[str]) -> str:
+    """
+    モデル設定・システムプロンプト・ユーザープロンプト・画像ハッシュからキャッシュキーを生成する。
+    """
+    settings = {k: v for k, v in api_params.items() if k not in ["messages", "tools"]}
+    key = hashlib.sha256()
+    key.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    key.update(api_params["messages"][0]["content"].encode("utf-8"))
+    key.update(user_prompt.encode("utf-8"))
+    for image_hash in image_hashes:
+        key.update(image_hash.encode("ascii"))
+    return key.hexdigest()
+
+def _get_cached_response(key: str) -> str | None:
+    with _response_cache_lock:
+        result_json = _response_cache.get(key)
+        if result_json is not None:
+            _response_cache.move_to_end(key)
+        return result_json
+
+def _store_cached_response(key: str, result_json: str) -> None:
+    with _response_cache_lock:
+        _response_cache[key] = result_json
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > RESPONSE_CACHE_MAX_ENTRIES:
+            _response_cache.popitem(last=False)
+
+def call_vision_api(client: "OpenAI", user_prompt: str, base64_images: list[str], model: str, custom_params: dict | None = None,
+                    image_hashes: list[str] | None = None):
+    """
+    画像と説明文を統合分析する。同一内容の画像は1枚にまとめて送信し、同一内容の解析結果はキャッシュから返す。
+    応答の構造検証は解析・検証を1回で済ませるため、後段のassess.process_ai_response（AI_RESPONSE_SCHEMA）で行う。
+
+    Args:
+        image_hashes: base64_imagesに対応する画像ハッシュ（utils.image_to_base64の'hash'）。省略時は内部で計算する
+    """
+    try:
+        base64_images, image_hashes = _dedupe_images(base64_images, image_hashes)
+        api_params = build_api_params(user_prompt, base64_images, model, custom_params)
+        cache_key = _response_cache_key(api_params, user_prompt, image_hashes)
+        cached = _get_cached_response(cache_key)
+        if cached is not None:
+            logger.info("API呼び出し: キャッシュ済みの解析結果を使用")
+            return cached
+
         response = client.chat.completions.create(**api_params)
         
         # Function Callingの結果は tool_calls[0].function.arguments にJSON文字列として入っている
         result_json = response.choices[0].message.tool_calls[0].function.arguments
+        _store_cached_response(cache_key, result_json)
         return result_json
 
-    except BadRequestError as e:
-        error_message = f"APIリクエストエラー（パラメータ不正）: {e}"
-        print(error_message)
-        return json.dumps({"error": error_message})
-    except APIError as e:
-        error_message = f"OpenAI APIエラーが発生しました: {e}"
-        print(error_message)
-        return json.dumps({"error": error_message})
     except Exception as e:
-        error_message = f"予期せぬエラーが発生しました: {e}"
-        print(error_message)
-        return json.dumps({"error": error_message})
+        return _error_response(e)
+
+async def call_vision_api_async(client: "AsyncOpenAI", user_prompt: str, base64_images: list[str], model: str, custom_params: dict | None = None,
+                                image_hashes: list[str] | None = None):
+    """
+    call_vision_apiの非同期版。待機中に他のリクエストを並行して進められる。
+    """
+    try:
+        base64_images, image_hashes = _dedupe_images(base64_images, image_hashes)
+        api_params = build_api_params(user_prompt, base64_images, model, custom_params)
+        cache_key = _response_cache_key(api_params, user_prompt, image_hashes)
+        cached = _get_cached_response(cache_key)
+        if cached is not None:
+            logger.info("API呼び出し: キャッシュ済みの解析結果を使用")
+            return cached
+
+        response = await client.chat.completions.create(**api_params)
+        result_json = response.choices[0].message.tool_calls[0].function.arguments
+        _store_cached_response(cache_key, result_json)
+        return result_json
+
+    except Exception as e:
+        return _error_response(e)
+
+async def call_vision_api_per_image(client: "AsyncOpenAI", user_prompt: str, base64_images: list[str], model: str, custom_params: dict | None = None) -> list[str]:
+    """
+    画像ごとに個別の解析リクエストを並行実行する。
+
+    Returns:
+        list[str]: base64_imagesと同じ順序の解析結果JSON文字列のリスト
+    """
+    return list(await asyncio.gather(
+        *(call_vision_api_async(client, user_prompt, [b64_img], model, custom_params) for b64_img in base64_images)
+    ))
 
 # --- パラメータテスト用関数 ---
 def test_model_parameters(model: str, test_params: dict = None) -> dict:
@@ -329,14 +532,14 @@ def test_model_parameters(model: str, test_params: dict = None) -> dict:
     validated_params = validate_model_parameters(model, test_params)
     
     # モデル別の推奨設定を取得
-    default_config = MODEL_CONFIGS.get(model, MODEL_CONFIGS["gpt-4.1-mini-2025-04-14"])
+    default_config = MODEL_CONFIGS.get(model, MODEL_CONFIGS[DEFAULT_MODEL])
     
     result = {
         "model": model,
         "input_params": test_params,
         "validated_params": validated_params,
         "default_config": default_config,
-        "is_gpt5": "gpt-5" in model.lower() or model == "gpt-5-mini",
+        "is_gpt5": is_gpt5_model(model),
         "recommendations": []
     }
     
@@ -4,9 +4,24 @@
 2段階目: シーン情報を基にした詳細なリスク分析
 """
 
-import json
-import openai
-from typing import Dict, List, Any
+import asyncio
+from typing import TYPE_CHECKING, Dict, Final, List, Any
+
+if TYPE_CHECKING:
+    # openaiの読み込みは重いため、型注釈のみに使用し実行時には読み込まない
+    import openai
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+try:
+    # プロジェクトルートがsys.pathにある場合
+    from app import models
+except ModuleNotFoundError:
+    # app/をカレントにして実行する場合のフォールバック
+    import models
 
 # 1段階目: 画像認識とシーン分類用のツールスキーマ
 SCENE_ANALYSIS_TOOL_SCHEMA = {
@@ -111,11 +126,8 @@ DETAILED_RISK_ANALYSIS_TOOL_SCHEMA = {
     }
 }
 
-def stage1_scene_analysis(client: openai.OpenAI, user_prompt: str, base64_images: List[str], model: str) -> Dict[str, Any]:
-    """
-    1段階目: 画像認識とシーン分類
-    """
-    SYSTEM_PROMPT = """あなたは画像分析の専門家です。画像を詳細に観察し、作業現場の種類と基本的なリスク要因を特定してください。
+# 1段階目のシステムプロンプトとツール指定（不変のため呼び出しごとに生成しない）
+STAGE1_SYSTEM_PROMPT: Final[str] = """あなたは画像分析の専門家です。画像を詳細に観察し、作業現場の種類と基本的なリスク要因を特定してください。
 
 以下の観点で分析してください：
 1. 作業現場の種類（建設現場、厨房、オフィスなど）
@@ -123,31 +135,35 @@ def stage1_scene_analysis(client: openai.OpenAI, user_prompt: str, base64_images
 3. 潜在的なリスク要因（安全設備の有無、作業環境の状態など）
 
 analyze_scene関数を呼び出して結果を構造化してください。"""
-    
-    try:
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": [{"type": "text", "text": user_prompt}] + \
-                [{"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64_img}"}} for b64_img in base64_images]}
-        ]
-
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            tools=[SCENE_ANALYSIS_TOOL_SCHEMA],
-            tool_choice={"type": "function", "function": {"name": "analyze_scene"}},
-            max_tokens=2000,
-        )
-        
-        result_json = response.choices[0].message.tool_calls[0].function.arguments
-        return json.loads(result_json)
+STAGE1_TOOLS: Final[list] = [SCENE_ANALYSIS_TOOL_SCHEMA]
+STAGE1_TOOL_CHOICE: Final[dict] = {"type": "function", "function": {"name": "analyze_scene"}}
+STAGE2_TOOLS: Final[list] = [DETAILED_RISK_ANALYSIS_TOOL_SCHEMA]
+STAGE2_TOOL_CHOICE: Final[dict] = {"type": "function", "function": {"name": "analyze_detailed_risks"}}
 
-    except Exception as e:
-        return {"error": f"1段階目分析でエラーが発生しました: {e}"}
+def _stage1_request(user_prompt: str, base64_images: List[str], model: str) -> Dict[str, Any]:
+    """
+    1段階目のAPI呼び出しパラメータを構築する（同期・非同期共通）
+    """
+    content: list = [None] * (1 + len(base64_images))
+    content[0] = {"type": "text", "text": user_prompt}
+    for i, b64_img in enumerate(base64_images, 1):
+        content[i] = {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64_img}"}}
+    messages = [
+        {"role": "system", "content": STAGE1_SYSTEM_PROMPT},
+        {"role": "user", "content": content}
+    ]
+
+    return {
+        "model": model,
+        "messages": messages,
+        "tools": STAGE1_TOOLS,
+        "tool_choice": STAGE1_TOOL_CHOICE,
+        "max_tokens": 2000,
+    }
 
-def stage2_risk_analysis(client: openai.OpenAI, user_prompt: str, scene_analysis: Dict[str, Any], model: str) -> Dict[str, Any]:
+def _stage2_request(user_prompt: str, scene_analysis: Dict[str, Any], model: str) -> Dict[str, Any]:
     """
-    2段階目: シーン分析結果を基にした詳細なリスク分析
+    2段階目のAPI呼び出しパラメータを構築する（同期・非同期共通）
     """
     # シーン分析結果をプロンプトに組み込む
     scene_context = f"""
@@ -170,37 +186,65 @@ def stage2_risk_analysis(client: openai.OpenAI, user_prompt: str, scene_analysis
 
 analyze_detailed_risks関数を呼び出して結果を構造化してください。"""
     
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+    return {
+        "model": model,
+        "messages": messages,
+        "tools": STAGE2_TOOLS,
+        "tool_choice": STAGE2_TOOL_CHOICE,
+        "max_tokens": 4000,
+    }
+
+def _merge_stage2(scene_analysis: Dict[str, Any], result_json: str) -> Dict[str, Any]:
+    """
+    シーン分析結果と2段階目の詳細分析結果を統合する
+    """
+    detailed_analysis = _json_loads(result_json)
+    return {
+        "scene_analysis": scene_analysis,
+        "findings": detailed_analysis.get("findings", []),
+        "suggestions": detailed_analysis.get("suggestions", [])
+    }
+
+def stage1_scene_analysis(client: "openai.OpenAI", user_prompt: str, base64_images: List[str], model: str) -> Dict[str, Any]:
+    """
+    1段階目: 画像認識とシーン分類
+    """
     try:
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt}
-        ]
-
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            tools=[DETAILED_RISK_ANALYSIS_TOOL_SCHEMA],
-            tool_choice={"type": "function", "function": {"name": "analyze_detailed_risks"}},
-            max_tokens=4000,
-        )
+        response = client.chat.completions.create(**_stage1_request(user_prompt, base64_images, model))
         
         result_json = response.choices[0].message.tool_calls[0].function.arguments
-        detailed_analysis = json.loads(result_json)
+        return _json_loads(result_json)
+
+    except Exception as e:
+        return {"error": f"1段階目分析でエラーが発生しました: {e}"}
+
+def stage2_risk_analysis(client: "openai.OpenAI", user_prompt: str, scene_analysis: Dict[str, Any], model: str) -> Dict[str, Any]:
+    """
+    2段階目: シーン分析結果を基にした詳細なリスク分析
+    """
+    try:
+        response = client.chat.completions.create(**_stage2_request(user_prompt, scene_analysis, model))
         
-        # シーン分析結果と詳細分析結果を統合
-        return {
-            "scene_analysis": scene_analysis,
-            "findings": detailed_analysis.get("findings", []),
-            "suggestions": detailed_analysis.get("suggestions", [])
-        }
+        result_json = response.choices[0].message.tool_calls[0].function.arguments
+        return _merge_stage2(scene_analysis, result_json)
 
     except Exception as e:
         return {"error": f"2段階目分析でエラーが発生しました: {e}"}
 
-def two_stage_analysis(client: openai.OpenAI, user_prompt: str, base64_images: List[str], model: str) -> Dict[str, Any]:
+def two_stage_analysis(client: "openai.OpenAI", user_prompt: str, base64_images: List[str], model: str,
+                       integrated: bool = False) -> Dict[str, Any]:
     """
     2段階推論による統合分析
+    integrated=Trueの場合は統合スキーマ（シーン分類＋リスク評価）による1回の呼び出しで済ませる
     """
+    if integrated:
+        return _json_loads(models.call_vision_api(client, user_prompt, base64_images, model))
+
     # 1段階目: 画像認識とシーン分類
     scene_analysis = stage1_scene_analysis(client, user_prompt, base64_images, model)
     
@@ -215,6 +259,69 @@ def two_stage_analysis(client: openai.OpenAI, user_prompt: str, base64_images: L
     
     return detailed_analysis
 
+# --- 非同期版（複数画像の並行分析用） ---
+async def stage1_scene_analysis_async(client: "openai.AsyncOpenAI", user_prompt: str, base64_images: List[str], model: str) -> Dict[str, Any]:
+    """
+    1段階目の非同期版
+    """
+    try:
+        response = await client.chat.completions.create(**_stage1_request(user_prompt, base64_images, model))
+        return _json_loads(response.choices[0].message.tool_calls[0].function.arguments)
+
+    except Exception as e:
+        return {"error": f"1段階目分析でエラーが発生しました: {e}"}
+
+async def stage2_risk_analysis_async(client: "openai.AsyncOpenAI", user_prompt: str, scene_analysis: Dict[str, Any], model: str) -> Dict[str, Any]:
+    """
+    2段階目の非同期版
+    """
+    try:
+        response = await client.chat.completions.create(**_stage2_request(user_prompt, scene_analysis, model))
+        return _merge_stage2(scene_analysis, response.choices[0].message.tool_calls[0].function.arguments)
+
+    except Exception as e:
+        return {"error": f"2段階目分析でエラーが発生しました: {e}"}
+
+async def two_stage_analysis_async(client: "openai.AsyncOpenAI", user_prompt: str, base64_images: List[str], model: str,
+                                   integrated: bool = False) -> Dict[str, Any]:
+    """
+    2段階推論による統合分析の非同期版
+    """
+    if integrated:
+        return _json_loads(await models.call_vision_api_async(client, user_prompt, base64_images, model))
+
+    scene_analysis = await stage1_scene_analysis_async(client, user_prompt, base64_images, model)
+    
+    if "error" in scene_analysis:
+        return scene_analysis
+    
+    return await stage2_risk_analysis_async(client, user_prompt, scene_analysis, model)
+
+async def two_stage_analysis_per_image_async(client: "openai.AsyncOpenAI", user_prompt: str, base64_images: List[str], model: str,
+                                             integrated: bool = False) -> List[Dict[str, Any]]:
+    """
+    画像ごとの2段階分析をasyncio.gatherで並行実行する。
+    各画像の1段階目→2段階目は順に実行されるが、画像間の通信待ちは重なる。
+
+    Returns:
+        List[Dict]: base64_imagesと同じ順序の分析結果のリスト
+    """
+    return list(await asyncio.gather(
+        *(two_stage_analysis_async(client, user_prompt, [b64_img], model, integrated) for b64_img in base64_images)
+    ))
+
+def two_stage_analysis_per_image(user_prompt: str, base64_images: List[str], model: str,
+                                 integrated: bool = False) -> List[Dict[str, Any]]:
+    """
+    two_stage_analysis_per_image_asyncの同期ラッパー。
+    AsyncOpenAIクライアントはイベントループに紐づくため、呼び出しごとにループ内で生成・破棄する。
+    """
+    async def _run() -> List[Dict[str, Any]]:
+        async with models.get_async_openai_client() as client:
+            return await two_stage_analysis_per_image_async(client, user_prompt, base64_images, model, integrated)
+
+    return asyncio.run(_run())
+
 # --- 動作確認用のサンプルコード ---
 if __name__ == '__main__':
     print("2段階推論の動作確認...")
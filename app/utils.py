@@ -1,14 +1,48 @@
 
 import base64
-from PIL import Image, ExifTags, ImageFile
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import io
+import logging
 import hashlib
-from typing import Optional, Dict, Any
-import imghdr
+from typing import TYPE_CHECKING, Optional, Dict, Any
 
-# PILの安全設定（破損ファイル/部分画像のロード許容とデコンプ爆弾対策）
-ImageFile.LOAD_TRUNCATED_IMAGES = True
-Image.MAX_IMAGE_PIXELS = 4096 * 4096  # Decompression bombの閾値
+if TYPE_CHECKING:
+    from PIL import Image as PILImage
+
+logger = logging.getLogger(__name__)
+
+# 送信用画像の長辺上限とJPEG品質（Vision APIの内部縮小後の解像度に合わせる）
+UPLOAD_MAX_SIDE = 1536
+UPLOAD_JPEG_QUALITY = 85
+
+def detect_image_kind(image_bytes: bytes) -> Optional[str]:
+    """
+    先頭のマジックバイトから画像形式を判定する（対応形式のJPEG/PNGのみ）。
+    
+    Args:
+        image_bytes: 画像のバイトデータ
+        
+    Returns:
+        str: 'jpeg' / 'png'、判定できない場合はNone
+    """
+    if image_bytes.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if image_bytes.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    return None
+
+@functools.lru_cache(maxsize=1)
+def _get_pil_image():
+    """
+    PIL.Imageモジュールを返す。PILの読み込みは起動時間を延ばすため、初回の画像処理時まで遅延する。
+    """
+    from PIL import Image, ImageFile
+
+    # PILの安全設定（破損ファイル/部分画像のロード許容とデコンプ爆弾対策）
+    ImageFile.LOAD_TRUNCATED_IMAGES = True
+    Image.MAX_IMAGE_PIXELS = 4096 * 4096  # Decompression bombの閾値
+    return Image
 
 def validate_image_file(uploaded_file) -> Dict[str, Any]:
     """
@@ -18,9 +52,10 @@ def validate_image_file(uploaded_file) -> Dict[str, Any]:
         uploaded_file: StreamlitのUploadedFileオブジェクト
         
     Returns:
-        dict: 検証結果 {'valid': bool, 'error': str, 'metadata': dict}
+        dict: 検証結果 {'valid': bool, 'error': str, 'metadata': dict, 'image': PIL.Image}
+              'image'はヘッダー解析済み（画素は未デコード）の画像で、後続処理で再オープンせずに使用できる
     """
-    result = {'valid': False, 'error': None, 'metadata': {}}
+    result = {'valid': False, 'error': None, 'metadata': {}, 'image': None}
     
     if uploaded_file is None:
         result['error'] = "ファイルが選択されていません"
@@ -42,23 +77,22 @@ def validate_image_file(uploaded_file) -> Dict[str, Any]:
     try:
         # 画像として読み込み可能かチェック
         image_bytes = uploaded_file.getvalue()
-        # imghdrで簡易フォーマット検出
-        kind = imghdr.what(None, h=image_bytes)
+        # 先頭のマジックバイトで簡易フォーマット検出（imghdrはPython 3.13で削除）
+        kind = detect_image_kind(image_bytes)
         if kind not in ["jpeg", "png"]:
             result['error'] = f"画像形式の検出に失敗、または未対応形式です（{kind}）"
             return result
 
-        # 画像として読み込み → verify で整合性チェック → 再オープン
-        bio = io.BytesIO(image_bytes)
-        image = Image.open(bio)
+        # verifyで整合性チェック（チャンク・CRCの検査のみで画素はデコードしない）。
+        # verify後の画像は使用できないため、後続処理用には別途オープンした画像を使う
+        Image = _get_pil_image()
         try:
-            image.verify()
+            Image.open(io.BytesIO(image_bytes)).verify()
         except Exception:
             result['error'] = "画像の整合性チェックに失敗しました"
             return result
-        bio.seek(0)
-        image = Image.open(bio)
-        
+        image = Image.open(io.BytesIO(image_bytes))
+
         # 画像サイズチェック
         width, height = image.size
         if width > 4096 or height > 4096:
@@ -74,6 +108,7 @@ def validate_image_file(uploaded_file) -> Dict[str, Any]:
             'mode': image.mode
         }
         
+        result['image'] = image
         result['valid'] = True
         return result
         
@@ -93,7 +128,7 @@ def remove_exif(image_bytes: bytes) -> bytes:
     """
     try:
         # 画像を読み込み
-        image = Image.open(io.BytesIO(image_bytes))
+        image = _get_pil_image().open(io.BytesIO(image_bytes))
         
         # 新しい画像として保存（EXIFなし）
         output = io.BytesIO()
@@ -105,9 +140,46 @@ def remove_exif(image_bytes: bytes) -> bytes:
         return output.getvalue()
         
     except Exception as e:
-        print(f"EXIF除去中にエラーが発生しました: {e}")
+        logger.warning("EXIF除去中にエラーが発生しました: %s", e)
         return image_bytes  # エラー時は元のデータを返す
 
+def downscale_image(image: "PILImage.Image", max_side: int = UPLOAD_MAX_SIDE, quality: int = UPLOAD_JPEG_QUALITY,
+                    keep_exif: bool = False) -> Optional[bytes]:
+    """
+    送信前に画像を長辺max_side以下へ縮小し、JPEGで再エンコードする。
+    Vision APIは内部で縮小するため、元解像度のまま送ると通信量だけが増える。
+    再エンコードによりEXIFも除去される（keep_exif=Trueの場合のみ引き継ぐ）。
+    
+    Args:
+        image: オープン済みの画像（validate_image_fileの'image'）
+        max_side: 長辺の上限（px）
+        quality: JPEG品質
+        keep_exif: EXIFを引き継ぐかどうか
+        
+    Returns:
+        bytes: 縮小・再エンコード後の画像バイトデータ（失敗時はNone）
+    """
+    try:
+        exif = image.info.get("exif", b"") if keep_exif else b""
+        # thumbnailは未デコードのJPEGに対してdraft()を適用するため、DCT段階で縮小デコードされる
+        Image = _get_pil_image()
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+            # JPEGは透過を持てないため白背景に合成する（単純なconvertでは透過部分が黒になり、暗い内容が見えなくなる）
+            image = image.convert("RGBA")
+            background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+            image = Image.alpha_composite(background, image).convert("RGB")
+        elif image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=quality, optimize=True, progressive=True, exif=exif)
+        return output.getvalue()
+        
+    except Exception as e:
+        logger.warning("画像の縮小中にエラーが発生しました: %s", e)
+        return None
+
 def blur_pii(image_bytes: bytes) -> bytes:
     """
     画像中のPII（個人を特定しうる情報）をぼかす。
@@ -123,11 +195,11 @@ def blur_pii(image_bytes: bytes) -> bytes:
         # 現在は基本的な実装のみ
         # 将来的にOpenCVやface_recognitionライブラリを使用して
         # 顔、名札、車番などを検出・ぼかし処理を実装予定
-        print("PIIぼかし処理（基本実装）")
+        logger.debug("PIIぼかし処理（基本実装）")
         return image_bytes
         
     except Exception as e:
-        print(f"PIIぼかし処理中にエラーが発生しました: {e}")
+        logger.warning("PIIぼかし処理中にエラーが発生しました: %s", e)
         return image_bytes
 
 def generate_image_hash(image_bytes: bytes) -> str:
@@ -140,7 +212,8 @@ def generate_image_hash(image_bytes: bytes) -> str:
     Returns:
         str: SHA256ハッシュ値
     """
-    return hashlib.sha256(image_bytes).hexdigest()
+    # 内容の同一性判定用であり署名・認証には使わないため、usedforsecurity=Falseを指定する
+    return hashlib.sha256(memoryview(image_bytes), usedforsecurity=False).hexdigest()
 
 def image_to_base64(uploaded_file, remove_exif_data: bool = True, blur_pii_data: bool = False):
     """
@@ -170,22 +243,26 @@ def image_to_base64(uploaded_file, remove_exif_data: bool = True, blur_pii_data:
         
         result['metadata'] = validation['metadata']
         
-        # 2. 画像データを取得
-        image_bytes = uploaded_file.getvalue()
+        # 2. 送信用に縮小・再エンコード（検証時にオープンした画像を使い、デコードは1回のみ。
+        #    再エンコードでEXIFも除去されるため、remove_exifによる再処理は不要）
+        image_bytes = downscale_image(validation['image'], keep_exif=not remove_exif_data)
+        if image_bytes is None:
+            # 縮小に失敗した場合のみ元データを取得する
+            image_bytes = uploaded_file.getvalue()
+            if remove_exif_data:
+                image_bytes = remove_exif(image_bytes)
         
         # 3. セキュリティ処理
-        if remove_exif_data:
-            image_bytes = remove_exif(image_bytes)
-        
         if blur_pii_data:
             image_bytes = blur_pii(image_bytes)
         
         # 4. ハッシュ生成（監査ログ用）
         result['hash'] = generate_image_hash(image_bytes)
         
-        # 5. Base64エンコード
-        base64_image = base64.b64encode(image_bytes).decode("utf-8")
-        result['base64'] = base64_image
+        # 5. Base64エンコード（Base64はASCIIのみのためasciiでデコードし、元のバイト列は即座に解放する）
+        base64_bytes = base64.b64encode(image_bytes)
+        del image_bytes
+        result['base64'] = base64_bytes.decode("ascii")
         result['success'] = True
         
         return result
@@ -194,6 +271,27 @@ def image_to_base64(uploaded_file, remove_exif_data: bool = True, blur_pii_data:
         result['error'] = f"画像の処理中にエラーが発生しました: {e}"
         return result
 
+# 複数画像の並列変換に使うスレッド数の上限
+BATCH_MAX_WORKERS = 8
+
+def batch_images_to_base64(uploaded_files, remove_exif_data: bool = True, blur_pii_data: bool = False) -> list:
+    """
+    複数の画像をimage_to_base64で並列に変換する。
+    JPEGのデコード/エンコード・SHA256・Base64はGILを解放するため、プロセスではなくスレッドで並列化する。
+
+    Args:
+        uploaded_files: StreamlitのUploadedFileオブジェクトのリスト
+        remove_exif_data: EXIFデータを除去するかどうか
+        blur_pii_data: PIIをぼかすかどうか
+
+    Returns:
+        list[dict]: uploaded_filesと同じ順序のimage_to_base64の結果
+    """
+    if len(uploaded_files) <= 1:
+        return [image_to_base64(f, remove_exif_data, blur_pii_data) for f in uploaded_files]
+    with ThreadPoolExecutor(max_workers=min(BATCH_MAX_WORKERS, len(uploaded_files))) as executor:
+        return list(executor.map(lambda f: image_to_base64(f, remove_exif_data, blur_pii_data), uploaded_files))
+
 # --- 既存の関数は上記で実装済み ---
 
 # --- 動作確認用のサンプルコード ---
@@ -204,7 +302,7 @@ if __name__ == '__main__':
     print("utils.py の概念的な動作確認...")
     
     # ダミーの画像ファイルを作成
-    dummy_image = Image.new('RGB', (100, 100), color = 'red')
+    dummy_image = _get_pil_image().new('RGB', (100, 100), color = 'red')
     dummy_bytes_io = io.BytesIO()
     dummy_image.save(dummy_bytes_io, format='PNG')
     dummy_bytes_io.seek(0)